@@ -1,19 +1,57 @@
+import collections
+import functools
 import inspect
 
 import re
+import sys
+import threading
+import types
 
 DEFAULT_SERVICE_NAME = "<< default service name >>"
 
 # Object to used as a marker of not initialized fields
 UNINITIALIZED = object()
 
+# Shared by all the services registered without extra arguments
+_EMPTY_DICT = types.MappingProxyType({})
+
+_CAMEL_CASE_WORD_RE = re.compile('(.)([A-Z][a-z]+)')
+_CAMEL_CASE_BOUNDARY_RE = re.compile('([a-z0-9])([A-Z])')
+
+
+@functools.lru_cache(maxsize=None)
+def _to_snake_case(name):
+    s1 = _CAMEL_CASE_WORD_RE.sub(r'\1_\2', name)
+    return _CAMEL_CASE_BOUNDARY_RE.sub(r'\1_\2', s1).lower()
+
+
+# Entry of the inject table, the fields are accessed by index on the hot paths
+InjectTableEntry = collections.namedtuple("InjectTableEntry", ["get_instance", "finalize", "raw_factory", "extra_args", "module"])
+
+_local = threading.local()
+
+
+def _get_in_progress():
+    """
+    :return: Ids of the factories whose instances are being created by the current thread, used to detect cyclic dependencies
+    """
+    in_progress = getattr(_local, "in_progress", None)
+    if in_progress is None:
+        in_progress = _local.in_progress = set()
+    return in_progress
+
+
 class InjectionError(AttributeError):
     pass
 
 
 class InjectionNotFoundError(InjectionError):
     def __init__(self, attribute_name, service_name):
-        super(AttributeError, self).__init__("Cannot inject attribute {} on service {} - the attribute cannot be found.".format(attribute_name, service_name))
+        # The message is only formatted when needed, see __str__
+        super(AttributeError, self).__init__(attribute_name, service_name)
+
+    def __str__(self):
+        return "Cannot inject attribute {} on service {} - the attribute cannot be found.".format(*self.args)
 
 
 class RecursiveInjectionError(InjectionError):
@@ -29,59 +67,69 @@ class MultipleYieldsError(InjectionError):
 class Injector:
     def __init__(self):
         self.inject_table = {}
+        # Incremented whenever the inject table changes, so that the cached dependencies can be resolved again
+        self.table_version = 0
 
     def get(self, name, for_service=None):
-        if name in self.inject_table:
-            obj = self.inject_table[name].get_instance
-            return obj
-
-        raise InjectionNotFoundError(name, for_service)
+        entry = self.inject_table.get(name)
+        if entry is None:
+            raise InjectionNotFoundError(name, for_service)
+        return entry[0]
 
     def all_injectors(self):
-        return {key: factory.get_instance for key, factory in self.inject_table.items()}
+        return {key: entry[0] for key, entry in self.inject_table.items()}
 
     def injectors_in_modules(self, *modules):
-        module_names = [m.__name__ for m in modules]
+        module_names = frozenset(m.__name__ for m in modules)
+
+        return {key: entry[0] for key, entry in self.inject_table.items()
+                if entry[4] in module_names}
 
-        return {key: factory.get_instance for key, factory in self.inject_table.items()
-                if factory.raw_factory.__module__ in module_names}
+    @staticmethod
+    def _get_kind(factory_func):
+        if isinstance(factory_func, type):
+            return "class"
+        code = getattr(factory_func, "__code__", None)
+        if code is not None and code.co_flags & inspect.CO_GENERATOR:
+            return "generator"
+        return "factory"
 
     def _get_wrapper(self, factory_func, service_name, inplace, extra_args):
-        if inspect.isclass(factory_func):
-            return ClassInjectingWrapper(self, service_name, inplace, extra_args)
-        elif inspect.isgeneratorfunction(factory_func):
-            return GeneratorInjectingWrapper(self, service_name, inplace, extra_args)
-        else:
-            return FactoryInjectingWrapper(self, service_name, inplace, extra_args)
+        return InjectingWrapper(self, self._get_kind(factory_func), service_name, inplace, extra_args)
 
     def __call__(self, service_name=DEFAULT_SERVICE_NAME, inplace=False, **extra_args):
-        factory_func = None
         if callable(service_name):
+            # Used as a bare decorator, the factory is wrapped straight away
             factory_func = service_name
-            service_name = DEFAULT_SERVICE_NAME
+            return self._get_wrapper(factory_func, DEFAULT_SERVICE_NAME, inplace, extra_args).wrap(factory_func)
 
         def injection_in_progress(factory_func):
             wrapper = self._get_wrapper(factory_func, service_name, inplace, extra_args)
             return wrapper.wrap(factory_func)
 
-        if factory_func:
-            return injection_in_progress(factory_func)
-        else:
-            return injection_in_progress
+        return injection_in_progress
 
     def finalize_all(self):
-        factories = self.inject_table.values()
-        for factory in factories:
-            factory.finalize()
+        entries = self.inject_table.values()
+        for entry in entries:
+            entry[1]()
 
 
-class InjectingWrapperBase:
-    def __init__(self, inject, service_name=DEFAULT_SERVICE_NAME, inplace=False, extra_args=None):
+class InjectingWrapper:
+    __slots__ = ('kind', 'inplace', 'extra_args', 'inject', 'service_name',
+                 '_param_names', '_delegates', '_recipe', '_recipe_version')
+
+    def __init__(self, inject, kind, service_name=DEFAULT_SERVICE_NAME, inplace=False, extra_args=None):
         super().__init__()
+        self.kind = kind
         self.inplace = inplace
-        self.extra_args = {} if extra_args is None else extra_args
+        self.extra_args = extra_args or _EMPTY_DICT
         self.inject = inject
         self.service_name = service_name
+        self._param_names = ()
+        self._delegates = ()
+        self._recipe = None
+        self._recipe_version = None
 
     def _get_name(self, factory_func):
         """
@@ -95,35 +143,45 @@ class InjectingWrapperBase:
         :return: String name of the service
         """
         if self.service_name is DEFAULT_SERVICE_NAME:
-            s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', factory_func.__name__)
-            return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
+            return _to_snake_case(factory_func.__name__)
         else:
             return str(self.service_name)
 
-    def _get_dependencies(self, factory_func, name):
-        signature = inspect.signature(factory_func)
-        dependencies = []
-
-        if hasattr(factory_func, "_instance_is_being_created"):
+    def _create(self, factory_func, name):
+        in_progress = _get_in_progress()
+        key = id(factory_func)
+        if key in in_progress:
             raise RecursiveInjectionError(name)
-        factory_func._instance_is_being_created = True
+        in_progress.add(key)
 
-        for par in signature.parameters:
-            dependency_factory = self.inject.get(par, name)
-            dependency = dependency_factory()
-            dependencies.append(dependency)
+        try:
+            recipe = self._recipe
+            if self._recipe_version != self.inject.table_version:
+                dependency_factories = tuple(self.inject.get(par, name) for par in self._param_names)
+                recipe = self._recipe = _make_recipe(factory_func, dependency_factories)
+                self._recipe_version = self.inject.table_version
 
-        del factory_func._instance_is_being_created
-        return dependencies
+            return recipe()
+        finally:
+            in_progress.discard(key)
 
     def wrap(self, factory_func):
         inject_name = self._get_name(factory_func)
+        # The factory cannot change after decoration, so its signature is inspected only once
+        self._param_names = tuple(inspect.signature(factory_func).parameters)
+        if self.kind == "class":
+            self._delegates = self._get_delegates(factory_func)
 
         provider, finalizer = self._get_provider_and_finalizer(factory_func)
 
-        result = provider if self.inplace else factory_func
-        self.inject.inject_table[inject_name] = result
+        self.inject.inject_table[inject_name] = InjectTableEntry(provider, finalizer, factory_func, self.extra_args,
+                                                                 factory_func.__module__)
+        self.inject.table_version += 1
 
+        result = provider if self.inplace else factory_func
+        if isinstance(result, type):
+            # Functions stored on a class would be bound as methods when accessed through its instances
+            provider, finalizer = staticmethod(provider), staticmethod(finalizer)
         result.raw_factory = factory_func
         result.get_instance = provider
         result.finalize = finalizer
@@ -131,106 +189,144 @@ class InjectingWrapperBase:
 
         return result
 
-    def _get_provider_and_finalizer(self, factory_func):
-        raise NotImplementedError("Must be implemented in subclasses")
-
-
-class FactoryInjectingWrapper(InjectingWrapperBase):
-    def _get_provider_and_finalizer(self, factory_func):
-
-        def provider():
-            if not provider._instance:
-                dependencies = self._get_dependencies(factory_func, factory_func.__name__)
-                provider._instance = factory_func(*dependencies)
-                if hasattr(factory_func, "_finalize"):
-                    provider._finalize = factory_func._finalize
-            return provider._instance
-
-        provider._instance = None
-
-        def finalizer():
-            if provider._instance is not None:
-                if hasattr(provider, "_finalize"):
-                    provider._finalize()
-                provider._instance = None
-
-        return provider, finalizer
-
-
-class ClassInjectingWrapper(InjectingWrapperBase):
     @staticmethod
     def _get_delegates(clazz):
-        return ((name, delegate) for name, delegate in clazz.__dict__.items() if isinstance(delegate, Injected))
+        return tuple((name, delegate) for name, delegate in clazz.__dict__.items() if isinstance(delegate, Injected))
 
     def _inject_delegates(self, clazz, instance, name):
-        if hasattr(clazz, "_instance_is_being_created"):
+        in_progress = _get_in_progress()
+        key = id(clazz)
+        if key in in_progress:
             raise RecursiveInjectionError(name)
-        clazz._instance_is_being_created = True
-
-        for name, delegate in self._get_delegates(clazz):
-            delegate.init(name, instance, self.inject.get(name, self.service_name))
+        in_progress.add(key)
 
-        del clazz._instance_is_being_created
+        try:
+            for name, delegate in self._delegates:
+                delegate.init(name, instance, self.inject.get(name, self.service_name))
+        finally:
+            in_progress.discard(key)
 
     def _reset_delegates(self, clazz, instance):
-        for name, delegate in self._get_delegates(clazz):
+        for name, delegate in self._delegates:
             delegate.reset(instance)
 
-    def _get_provider_and_finalizer(self, clazz):
-
+    def _get_provider_and_finalizer(self, factory_func):
+        return _PROVIDER_BUILDERS[self.kind](self, factory_func)
+
+
+def _make_recipe(factory_func, dependency_factories):
+    """
+    Specializes the call of the factory for its resolved dependencies, so that the common arities need no loop.
+    :param factory_func: The factory to be called
+    :param dependency_factories: Providers of the factory's arguments, in the order of its parameters
+    :return: Callable without arguments, which calls the factory with the instances of the dependencies
+    """
+    if len(dependency_factories) == 1:
+        d0, = dependency_factories
+        return lambda: factory_func(d0())
+    elif len(dependency_factories) == 2:
+        d0, d1 = dependency_factories
+        return lambda: factory_func(d0(), d1())
+    elif len(dependency_factories) == 3:
+        d0, d1, d2 = dependency_factories
+        return lambda: factory_func(d0(), d1(), d2())
+    else:
+        return lambda: factory_func(*[dependency_factory() for dependency_factory in dependency_factories])
+
+
+def _make_factory_provider(wrapper, factory_func):
+    # [instance, finalize function]
+    state = [None, None]
+
+    def provider():
+        if not state[0]:
+            # Most of the services have no parameters, so there is nothing to resolve
+            state[0] = wrapper._create(factory_func, factory_func.__name__) if wrapper._param_names else factory_func()
+            state[1] = getattr(factory_func, "_finalize", None)
+        return state[0]
+
+    def finalizer():
+        if state[0] is not None:
+            finalize = state[1]
+            if finalize is not None:
+                finalize()
+            state[0] = state[1] = None
+
+    return provider, finalizer
+
+
+def _make_class_provider(wrapper, clazz):
+    # [instance]
+    state = [None]
+
+    def get_instance():
+        if state[0] is None:
+            state[0] = wrapper._create(clazz, wrapper.service_name) if wrapper._param_names else clazz()
+            if wrapper._delegates:
+                wrapper._inject_delegates(clazz, state[0], wrapper.service_name)
+
+        return state[0]
+
+    def finalizer():
+        instance = state[0]
+        if instance is not None:
+            finalize = getattr(instance, "_finalize", None)
+            if finalize is not None:
+                finalize()
+            wrapper._reset_delegates(clazz, instance)
+            state[0] = None
+
+    if wrapper.inplace:
+        # The decorated name is bound to the provider, so it must stay a class and return the single instance
         class Provider(clazz):
             def __new__(cls):
-                if getattr(clazz, "_instance", None) is None:
-                    dependencies = self._get_dependencies(clazz, self.service_name)
-                    clazz._instance = clazz(*dependencies)
-                    self._inject_delegates(clazz, clazz._instance, self.service_name)
-
-                return clazz._instance
+                return get_instance()
 
             def __init__(self):
                 pass
 
-        def finalizer():
-            if getattr(clazz, "_instance", None) is not None:
-                if hasattr(clazz._instance, "_finalize"):
-                    clazz._instance._finalize()
-                self._reset_delegates(clazz, clazz._instance)
-                del clazz._instance
-
         return Provider, finalizer
 
+    return get_instance, finalizer
+
 
-class GeneratorInjectingWrapper(InjectingWrapperBase):
-    def _get_provider_and_finalizer(self, generator):
+def _make_generator_provider(wrapper, generator):
+    # [instance, generator object]
+    state = [None, None]
 
-        def provider():
-            if not provider._instance:
-                dependencies = self._get_dependencies(generator, generator.__name__)
-                provider._generator = generator(*dependencies)
-                provider._instance = next(provider._generator)
-            return provider._instance
+    def provider():
+        if not state[0]:
+            state[1] = wrapper._create(generator, generator.__name__) if wrapper._param_names else generator()
+            state[0] = next(state[1])
+        return state[0]
 
-        provider._instance = None
-        provider._generator = None
+    def finalizer():
+        if state[0] is not None:
+            if state[1] is not None:
+                try:
+                    next(state[1])  # This should raise StopIteration, otherwise the generator contains multiple yields, which is not allowed
+                    raise MultipleYieldsError()
+                except StopIteration:
+                    pass
+                state[1] = None
+            state[0] = None
 
-        def finalizer():
-            if provider._instance is not None:
-                if provider._generator is not None:
-                    try:
-                        next(provider._generator)  # This should raise StopIteration, otherwise the generator contains multiple yields, which is not allowed
-                        raise MultipleYieldsError()
-                    except StopIteration:
-                        pass
-                    provider._generator = None
-                provider._instance = None
+    return provider, finalizer
 
-        return provider, finalizer
+
+_PROVIDER_BUILDERS = {
+    "class": _make_class_provider,
+    "generator": _make_generator_provider,
+    "factory": _make_factory_provider,
+}
 
 
 class Injected:
     FACTORY = ":factory"
     INSTANCE = ":instance"
-    
+
+    __slots__ = ('name', 'lazy', '__factory_key', '__instance_key')
+
     def __init__(self, lazy=False):
         self.name = None
         self.lazy = lazy
@@ -241,10 +337,10 @@ class Injected:
         self.name = name
 
         if self.lazy:
-            self.__factory_key = name + Injected.FACTORY
+            self.__factory_key = sys.intern(name + Injected.FACTORY)
             instance.__dict__[self.__factory_key] = factory
         else:
-            self.__instance_key = name + Injected.INSTANCE
+            self.__instance_key = sys.intern(name + Injected.INSTANCE)
             instance.__dict__[self.__instance_key] = factory()
 
     def reset(self, instance):
@@ -252,10 +348,8 @@ class Injected:
         instance.__dict__.pop(self.__instance_key, None)
 
     def __get__(self, instance, owner):
-        if self.lazy:
-            return instance.__dict__[self.__factory_key]()
-        else:
-            return instance.__dict__[self.__instance_key]
+        d = instance.__dict__
+        return d[self.__factory_key]() if self.lazy else d[self.__instance_key]
 
 
 inject = Injector()
@@ -2,13 +2,11 @@ import pytest
 
 
 def injects_to_pytest_fixtures(inject, scope, only_modules=None):
-    for key, factory in inject.inject_table.items():
-        def get_get_instance(key, factory):
-            def get_instance(request):
-                request.addfinalizer(factory.finalize)
-                return factory.get_instance()
-
-            return get_instance
-
-        pytest_scope = factory.extra_args.get("pytest_scope", "session")
-        scope[key] = pytest.fixture(scope=pytest_scope)(get_get_instance(key, factory))
+    for key, entry in inject.inject_table.items():
+        # The callables are bound as defaults, pytest does not treat arguments with default values as fixtures
+        def get_instance(request, _finalize=entry.finalize, _get_instance=entry.get_instance):
+            request.addfinalizer(_finalize)
+            return _get_instance()
+
+        pytest_scope = entry.extra_args.get("pytest_scope", "session")
+        scope[key] = pytest.fixture(scope=pytest_scope)(get_instance)
@@ -1,4 +1,5 @@
 import inspect
+import threading
 
 import pytest
 
@@ -198,6 +199,8 @@ def test_unfilled_dependency():
 
     with pytest.raises(InjectionNotFoundError) as error:
         unfilled_dependency_factory.get_instance()
+    assert str(error.value) == "Cannot inject attribute non_existing_object on service unfilled_dependency_factory" \
+                               " - the attribute cannot be found."
 
 
 def test_all_injectors():
@@ -366,6 +369,7 @@ def test_decorated_class_is_still_class():
 
     assert inspect.isclass(X)
     assert inspect.isclass(Y)
+    assert Y.get_instance().get_instance() is Y.get_instance()
 
 
 def test_decorated_class_scope():
@@ -649,3 +653,113 @@ def test_repeated_init():
 
 
 
+
+
+def test_dependency_registered_again_after_finalize():
+    inject = Injector()
+
+    @inject("hello")
+    def hello_v1():
+        return "hello"
+
+    @inject
+    def greeting(hello):
+        return hello + " Dusan"
+
+    assert greeting.get_instance() == "hello Dusan"
+
+    @inject("hello")
+    def hello_v2():
+        return "ahoj"
+
+    # The existing instance is kept until it is finalized
+    assert greeting.get_instance() == "hello Dusan"
+    greeting.finalize()
+    assert greeting.get_instance() == "ahoj Dusan"
+
+
+def test_failed_injection_can_be_retried():
+    inject = Injector()
+
+    @inject
+    def greeting(hello):
+        return hello + " Dusan"
+
+    with pytest.raises(InjectionNotFoundError):
+        greeting.get_instance()
+
+    @inject
+    def hello():
+        return "hello"
+
+    assert greeting.get_instance() == "hello Dusan"
+
+
+def test_class_injected_to_two_injectors():
+    class X:
+        pass
+
+    inject1 = Injector()
+    inject2 = Injector()
+    x1 = inject1(X).get_instance
+    x2 = inject2(X).get_instance
+
+    assert x1() is x1()
+    assert x1() is not x2()
+    assert not hasattr(X, "_instance")
+
+
+def test_factory_with_many_dependencies():
+    inject = Injector()
+
+    inject("a")(lambda: "a")
+    inject("b")(lambda: "b")
+    inject("c")(lambda: "c")
+    inject("d")(lambda: "d")
+
+    @inject
+    def abc(a, b, c):
+        return a + b + c
+
+    @inject
+    def abcd(a, b, c, d):
+        return a + b + c + d
+
+    assert abc.get_instance() == "abc"
+    assert abcd.get_instance() == "abcd"
+
+
+def test_concurrent_injection_is_not_recursive():
+    inject = Injector()
+    started = threading.Event()
+    proceed = threading.Event()
+
+    @inject
+    def slow():
+        if not started.is_set():
+            started.set()
+            proceed.wait(5)
+        return "slow"
+
+    @inject
+    def greeting(slow):
+        return slow + "!"
+
+    errors = []
+
+    def create():
+        try:
+            greeting.get_instance()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=create)
+    thread.start()
+    started.wait(5)
+
+    # The greeting is being created by the other thread at the moment
+    create()
+    proceed.set()
+    thread.join()
+
+    assert errors == []